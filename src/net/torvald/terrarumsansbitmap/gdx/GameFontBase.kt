@@ -31,10 +31,9 @@ import com.badlogic.gdx.graphics.Texture
 import com.badlogic.gdx.graphics.g2d.*
 import com.badlogic.gdx.utils.GdxRuntimeException
 import net.torvald.terrarumsansbitmap.GlyphProps
-import java.io.BufferedOutputStream
-import java.io.FileOutputStream
 import java.security.MessageDigest
 import java.util.*
+import java.util.concurrent.ConcurrentHashMap
 import java.util.zip.CRC32
 import java.util.zip.GZIPInputStream
 import kotlin.math.roundToInt
@@ -108,7 +107,7 @@ class GameFontBase(
     /**
      * lowercase AND the height is equal to x-height (e.g. lowercase B, D, F, H, K, L, ... does not count
      */
-    private fun CodePoint.isLowHeight() = this in lowHeightLetters
+    private fun CodePoint.isLowHeight() = getKernClass(this) hasKernClass KERN_LOWHEIGHT
 
 
     // TODO (val posXbuffer: IntArray, val posYbuffer: IntArray) -> (val linotype: Pixmap)
@@ -132,20 +131,22 @@ class GameFontBase(
     /**
      * Insertion sorts the last element fo the textCache
      */
-    private fun addToCache(text: CodepointSequence, linotype: Texture, width: Int) {
+    private fun addToCache(text: CodepointSequence, hash: Hash, linotype: Texture, width: Int) {
         // Caching rules:
         // 1. always accept new element.
         // 2. often-called element have higher chance of survival (see: getCache(long))
 
 
         if (textCacheCap < textCacheSize) {
-            textCache[textCacheCap] = TextCacheObj(0, text.getHash(), ShittyGlyphLayout(text, linotype, width))
+            textCache[textCacheCap] = TextCacheObj(0, hash, ShittyGlyphLayout(text, linotype, width))
             textCacheCap += 1
 
             // make everybody age
             textCache.forEach {
                 it.age += 1
             }
+
+            sortCacheElem(textCacheCap - 1)
         }
         else {
             // search for an oldest element
@@ -166,11 +167,31 @@ class GameFontBase(
             textCache[oldestElemIndex].dispose()
 
             // overwrite oldest one
-            textCache[oldestElemIndex] = TextCacheObj(0, text.getHash(), ShittyGlyphLayout(text, linotype, width))
+            textCache[oldestElemIndex] = TextCacheObj(0, hash, ShittyGlyphLayout(text, linotype, width))
+
+            sortCacheElem(oldestElemIndex)
+        }
+    }
+
+    /**
+     * Moves the element at the given index into its place, so that textCache[0 until textCacheCap] stays sorted
+     * by the hash. Only the newly added element can be out of order, so there is no need to sort the whole array;
+     * the unused slots past textCacheCap are left alone.
+     */
+    private fun sortCacheElem(index: Int) {
+        val elem = textCache[index]
+        var i = index
+
+        while (i > 0 && textCache[i - 1].hash > elem.hash) {
+            textCache[i] = textCache[i - 1]
+            i -= 1
+        }
+        while (i < textCacheCap - 1 && textCache[i + 1].hash < elem.hash) {
+            textCache[i] = textCache[i + 1]
+            i += 1
         }
 
-        // sort the list
-        textCache.sortBy { it.hash }
+        textCache[i] = elem
     }
 
     private fun getCache(hash: Long): TextCacheObj? {
@@ -229,6 +250,20 @@ class GameFontBase(
 
     /** Props of all printable Unicode points. */
     private val glyphProps: HashMap<CodePoint, GlyphProps> = HashMap()
+    /** Props of the BMP, indexed by the code point itself; the HashMap only holds what lies outside of it */
+    private val glyphPropsBMP = arrayOfNulls<GlyphProps>(0x10000)
+
+    private fun getGlyphProps(c: CodePoint): GlyphProps? = if (c in 0..0xFFFF) glyphPropsBMP[c] else glyphProps[c]
+
+    private fun setGlyphProps(c: CodePoint, props: GlyphProps) {
+        if (c in 0..0xFFFF) glyphPropsBMP[c] = props else glyphProps[c] = props
+    }
+
+    /** Props without extra info are fully described by their width and tags, so equal ones share an instance */
+    private val glyphPropsPool = HashMap<Int, GlyphProps>()
+
+    private fun getSharedGlyphProps(width: Int, tags: Int, newProps: GlyphProps = GlyphProps(width, tags)) =
+            glyphPropsPool.getOrPut(width.shl(16) or tags) { newProps }
     private val sheets: Array<PixmapRegionPack>
 
     private var charsetOverride = 0
@@ -273,18 +308,13 @@ class GameFontBase(
 
             // unpack gz if applicable
             if (it.endsWith(".gz")) {
-                val tmpFileName = "tmp_${it.dropLast(7)}.tga"
-
                 try {
                     val gzi = GZIPInputStream(Gdx.files.internal(fontParentDir + it).read(8192))
                     val wholeFile = gzi.readBytes()
                     gzi.close()
-                    val fos = BufferedOutputStream(FileOutputStream(tmpFileName))
-                    fos.write(wholeFile)
-                    fos.flush()
-                    fos.close()
 
-                    pixmap = Pixmap(Gdx.files.internal(tmpFileName))
+                    // decode straight from memory; no need to round-trip through a temp file
+                    pixmap = Pixmap(wholeFile, 0, wholeFile.size)
                 }
                 catch (e: GdxRuntimeException) {
                     //e.printStackTrace()
@@ -292,7 +322,6 @@ class GameFontBase(
 
                     pixmap = Pixmap(1, 1, Pixmap.Format.RGBA8888)
                 }
-                //File(tmpFileName).delete()
             }
             else {
                 try {
@@ -312,8 +341,7 @@ class GameFontBase(
                 }
             }
 
-            if (isVariable) buildWidthTable(pixmap, codeRange[index], 16)
-            buildWidthTableFixed()
+            if (isVariable) buildWidthTable(pixmap, codeRange[index].flatten(), 16)
 
 
             /*if (!noShadow) {
@@ -356,12 +384,15 @@ class GameFontBase(
             pixmap.dispose() // you are terminated
         }
 
+        // fixed-width props do not depend on any sheet; fill them once, after the variable ones
+        buildWidthTableFixed()
+
         sheets = sheetsPack.toTypedArray()
 
         // make sure null char is actually null (draws nothing and has zero width)
         sheets[SHEET_ASCII_VARW].regions[0].setColor(0)
         sheets[SHEET_ASCII_VARW].regions[0].fill()
-        glyphProps[0] = GlyphProps(0, 0)
+        setGlyphProps(0, GlyphProps(0, 0))
     }
 
     override fun getLineHeight(): Float = H.toFloat()
@@ -383,8 +414,11 @@ class GameFontBase(
         setOwnsTexture(true)
     }
 
-    private val offsetUnihan = (H - H_UNIHAN) / 2
-    private val offsetCustomSym = (H - SIZE_CUSTOM_SYM) / 2
+    /** Vertical offset of the sheets whose cells are shorter than [H], indexed by the sheet (SHEET_UNKNOWN included) */
+    private val sheetOffsetY = IntArray(256).also { offsets ->
+        offsets[SHEET_UNIHAN] = (H - H_UNIHAN) / 2
+        offsets[SHEET_CUSTOM_SYM] = (H - SIZE_CUSTOM_SYM) / 2
+    }
 
     private var flagFirstRun = true
     private var textBuffer = CodepointSequence(256)
@@ -416,16 +450,18 @@ class GameFontBase(
 
         originalColour = batch.color.cpy()
         val mainColObj = originalColour
-        var mainCol: Int = originalColour.toRGBA8888().forceOpaque()
+        var mainCol: Int = Color.rgba8888(originalColour).forceOpaque()
 
-        val charSeqHash = charSeq.toCodePoints().getHash()
+        // convert and hash only once; both are reused when the text has to be typeset
+        val charSeqCodepoints = charSeq.toCodePoints()
+        val charSeqHash = charSeqCodepoints.getHash()
 
         if (charSeqNotBlank) {
 
             val cacheObj = getCache(charSeqHash)
 
             if (cacheObj == null || flagFirstRun) {
-                textBuffer = charSeq.toCodePoints()
+                textBuffer = charSeqCodepoints
 
                 val (posXbuffer, posYbuffer) = buildPosMap(textBuffer)
 
@@ -452,13 +488,13 @@ class GameFontBase(
                     val c = textBuffer[index]
                     val sheetID = getSheetType(c)
                     val (sheetX, sheetY) =
-                            if (index == 0) getSheetwisePosition(0, c)
-                            else getSheetwisePosition(textBuffer[index - 1], c)
+                            if (index == 0) getSheetwisePosition(0, c, sheetID)
+                            else getSheetwisePosition(textBuffer[index - 1], c, sheetID)
                     val hash = getHash(c) // to be used with Bad Transmission Modifier
 
                     if (isColourCode(c)) {
                         if (c == 0x100000) {
-                            mainCol = originalColour.toRGBA8888().forceOpaque()
+                            mainCol = Color.rgba8888(originalColour).forceOpaque()
                         }
                         else {
                             mainCol = getColour(c)
@@ -506,14 +542,12 @@ class GameFontBase(
                         index += hangulLength - 1
 
                     }
+                    else if (c == 0) {
+                        // null char is blanked out on init, drawing it would be a no-op (every text is padded with two)
+                    }
                     else {
                         try {
-                            val posY = posYbuffer[index].flipY() +
-                                    if (sheetID == SHEET_UNIHAN) // evil exceptions
-                                        offsetUnihan
-                                    else if (sheetID == SHEET_CUSTOM_SYM)
-                                        offsetCustomSym
-                                    else 0
+                            val posY = posYbuffer[index].flipY() + sheetOffsetY[sheetID] // evil exceptions
 
                             val posX = posXbuffer[index]
                             val texture = sheets[sheetID].get(sheetX, sheetY)
@@ -541,7 +575,7 @@ class GameFontBase(
 
                 // put things into cache
                 //textCache[charSeq] = ShittyGlyphLayout(textBuffer, linotype!!)
-                addToCache(textBuffer, tempLinotype, posXbuffer.last())
+                addToCache(textBuffer, charSeqHash, tempLinotype, posXbuffer.last())
                 linotypePixmap.dispose()
             }
             else {
@@ -571,7 +605,7 @@ class GameFontBase(
         return null
     }
 
-    private fun Int.charInfo() = "U+${this.toString(16).padStart(4, '0').toUpperCase()}: ${Character.getName(this)}"
+    private fun Int.charInfo() = "${this.toHex()}: ${Character.getName(this)}"
 
 
     override fun dispose() {
@@ -581,174 +615,38 @@ class GameFontBase(
     }
 
     private fun getSheetType(c: CodePoint): Int {
-        if (charsetOverride == 1 && isBulgarian(c))
-            return SHEET_BULGARIAN_VARW
-        else if (charsetOverride == 2 && isBulgarian(c))
-            return SHEET_SERBIAN_VARW
-        else if (isHangul(c))
-            return SHEET_HANGUL
+        if (isBulgarian(c) && charsetOverrideSheet[charsetOverride] >= 0)
+            return charsetOverrideSheet[charsetOverride]
+        else if (c in 0..0xFFFF)
+            return sheetOfBMP[c].toInt() and 0xFF
         else if (isKana(c))
             return SHEET_KANA
-        else if (isUniHan(c))
-            return SHEET_UNIHAN
-        else if (isAscii(c))
-            return SHEET_ASCII_VARW
-        else if (isExtA(c))
-            return SHEET_EXTA_VARW
-        else if (isExtB(c))
-            return SHEET_EXTB_VARW
-        else if (isCyrilic(c))
-            return SHEET_CYRILIC_VARW
-        else if (isUniPunct(c))
-            return SHEET_UNI_PUNCT_VARW
-        else if (isCJKPunct(c))
-            return SHEET_CJK_PUNCT
-        else if (isFullwidthUni(c))
-            return SHEET_FW_UNI
-        else if (isGreek(c))
-            return SHEET_GREEK_VARW
-        else if (isThai(c))
-            return SHEET_THAI_VARW
-        else if (isCustomSym(c))
-            return SHEET_CUSTOM_SYM
-        else if (isArmenian(c))
-            return SHEET_HAYEREN_VARW
-        else if (isKartvelian(c))
-            return SHEET_KARTULI_VARW
-        else if (isIPA(c))
-            return SHEET_IPA_VARW
-        else if (isRunic(c))
-            return SHEET_RUNIC
-        else if (isLatinExtAdd(c))
-            return SHEET_LATIN_EXT_ADD_VARW
-        else if (isCherokee(c))
-            return SHEET_TSALAGI_VARW
-        else if (isInsular(c))
-            return SHEET_INSUAR_VARW
-        else if (isNagariBengali(c))
-            return SHEET_NAGARI_BENGALI_VARW
-        else if (isKartvelianCaps(c))
-            return SHEET_KARTULI_CAPS_VARW
-        else if (isDiacriticalMarks(c))
-            return SHEET_DIACRITICAL_MARKS_VARW
-        else if (isPolytonicGreek(c))
-            return SHEET_GREEK_POLY_VARW
-        else if (isExtC(c))
-            return SHEET_EXTC_VARW
-        else if (isExtD(c))
-            return SHEET_EXTD_VARW
         else
             return SHEET_UNKNOWN
-        // fixed width
-        // fallback
     }
 
-    private fun getSheetwisePosition(cPrev: Int, ch: Int): IntArray {
+    /**
+     * @param sheet sheet of the [ch] as given by [getSheetType], which the caller already has at hand
+     */
+    private fun getSheetwisePosition(cPrev: Int, ch: Int, sheet: Int): IntArray {
         val sheetX: Int; val sheetY: Int
-        when (getSheetType(ch)) {
+        when (sheet) {
             SHEET_UNIHAN -> {
                 sheetX = unihanIndexX(ch)
                 sheetY = unihanIndexY(ch)
             }
-            SHEET_EXTA_VARW -> {
-                sheetX = extAindexX(ch)
-                sheetY = extAindexY(ch)
-            }
-            SHEET_EXTB_VARW -> {
-                sheetX = extBindexX(ch)
-                sheetY = extBindexY(ch)
-            }
             SHEET_KANA -> {
                 sheetX = kanaIndexX(ch)
                 sheetY = kanaIndexY(ch)
             }
-            SHEET_CJK_PUNCT -> {
-                sheetX = cjkPunctIndexX(ch)
-                sheetY = cjkPunctIndexY(ch)
-            }
-            SHEET_CYRILIC_VARW -> {
-                sheetX = cyrilicIndexX(ch)
-                sheetY = cyrilicIndexY(ch)
-            }
-            SHEET_FW_UNI -> {
-                sheetX = fullwidthUniIndexX(ch)
-                sheetY = fullwidthUniIndexY(ch)
-            }
-            SHEET_UNI_PUNCT_VARW -> {
-                sheetX = uniPunctIndexX(ch)
-                sheetY = uniPunctIndexY(ch)
-            }
-            SHEET_GREEK_VARW -> {
-                sheetX = greekIndexX(ch)
-                sheetY = greekIndexY(ch)
-            }
-            SHEET_THAI_VARW -> {
-                sheetX = thaiIndexX(ch)
-                sheetY = thaiIndexY(ch)
-            }
-            SHEET_CUSTOM_SYM -> {
-                sheetX = symbolIndexX(ch)
-                sheetY = symbolIndexY(ch)
-            }
-            SHEET_HAYEREN_VARW -> {
-                sheetX = armenianIndexX(ch)
-                sheetY = armenianIndexY(ch)
-            }
-            SHEET_KARTULI_VARW -> {
-                sheetX = kartvelianIndexX(ch)
-                sheetY = kartvelianIndexY(ch)
-            }
-            SHEET_IPA_VARW -> {
-                sheetX = ipaIndexX(ch)
-                sheetY = ipaIndexY(ch)
-            }
-            SHEET_RUNIC -> {
-                sheetX = runicIndexX(ch)
-                sheetY = runicIndexY(ch)
-            }
-            SHEET_LATIN_EXT_ADD_VARW -> {
-                sheetX = latinExtAddX(ch)
-                sheetY = latinExtAddY(ch)
-            }
-            SHEET_BULGARIAN_VARW, SHEET_SERBIAN_VARW -> { // expects Unicode charpoint, NOT an internal one
-                sheetX = cyrilicIndexX(ch)
-                sheetY = cyrilicIndexY(ch)
-            }
-            SHEET_TSALAGI_VARW -> {
-                sheetX = cherokeeIndexX(ch)
-                sheetY = cherokeeIndexY(ch)
-            }
             SHEET_INSUAR_VARW -> {
                 sheetX = insularIndexX(ch)
                 sheetY = insularIndexY(ch)
             }
-            SHEET_NAGARI_BENGALI_VARW -> {
-                sheetX = nagariIndexX(ch)
-                sheetY = nagariIndexY(ch)
-            }
-            SHEET_KARTULI_CAPS_VARW -> {
-                sheetX = kartvelianCapsIndexX(ch)
-                sheetY = kartvelianCapsIndexY(ch)
-            }
-            SHEET_DIACRITICAL_MARKS_VARW -> {
-                sheetX = diacriticalMarksIndexX(ch)
-                sheetY = diacriticalMarksIndexY(ch)
-            }
-            SHEET_GREEK_POLY_VARW -> {
-                sheetX = polytonicGreekIndexX(ch)
-                sheetY = polytonicGreekIndexY(ch)
-            }
-            SHEET_EXTC_VARW -> {
-                sheetX = extCIndexX(ch)
-                sheetY = extCIndexY(ch)
-            }
-            SHEET_EXTD_VARW -> {
-                sheetX = extDIndexX(ch)
-                sheetY = extDIndexY(ch)
-            }
-            else -> {
-                sheetX = ch % 16
-                sheetY = ch / 16
+            else -> { // 16 glyphs per row, counting from the sheet's first codepoint
+                val offset = ch - sheetCodeOffset[sheet]
+                sheetX = offset % 16
+                sheetY = offset / 16
             }
         }
 
@@ -793,13 +691,15 @@ class GameFontBase(
             if (isDiacritics)
                 glyphWidth = -glyphWidth*/
 
-            glyphProps[code] = GlyphProps(width, tags)
+            val newProps = GlyphProps(width, tags)
+            val extCount = newProps.requiredExtInfoCount()
+            val props = if (extCount == 0) getSharedGlyphProps(width, tags, newProps) else newProps
+            setGlyphProps(code, props)
 
             // extra info
-            val extCount = glyphProps[code]?.requiredExtInfoCount() ?: 0
             if (extCount > 0) {
 
-                glyphProps[code]?.extInfo = IntArray(extCount)
+                props.extInfo = IntArray(extCount)
 
                 for (x in 0 until extCount) {
                     var info = 0
@@ -810,35 +710,46 @@ class GameFontBase(
                         }
                     }
 
-                    glyphProps[code]!!.extInfo!![x] = info
+                    props.extInfo!![x] = info
                 }
             }
         }
     }
 
+    /**
+     * Every code point in the range gets the same props object; fixed-width glyphs have no extra info that could
+     * differ between them.
+     */
+    private fun Iterable<Int>.setFixedWidth(width: Int) {
+        val props = getSharedGlyphProps(width, 0)
+        this.forEach { setGlyphProps(it, props) }
+    }
+
+    private fun List<IntRange>.setFixedWidth(width: Int) = this.forEach { it.setFixedWidth(width) }
+
     private fun buildWidthTableFixed() {
         // fixed-width props
-        codeRange[SHEET_CJK_PUNCT].forEach { glyphProps[it] = GlyphProps(W_ASIAN_PUNCT, 0) }
-        codeRange[SHEET_CUSTOM_SYM].forEach { glyphProps[it] = GlyphProps(20, 0) }
-        codeRange[SHEET_FW_UNI].forEach { glyphProps[it] = GlyphProps(W_UNIHAN, 0) }
-        codeRange[SHEET_HANGUL].forEach { glyphProps[it] = GlyphProps(W_HANGUL_BASE, 0) }
-        codeRangeHangulCompat.forEach { glyphProps[it] = GlyphProps(W_HANGUL_BASE, 0) }
-        codeRange[SHEET_KANA].forEach { glyphProps[it] = GlyphProps(W_KANA, 0) }
-        codeRange[SHEET_RUNIC].forEach { glyphProps[it] = GlyphProps(9, 0) }
-        codeRange[SHEET_UNIHAN].forEach { glyphProps[it] = GlyphProps(W_UNIHAN, 0) }
-        (0xD800..0xDFFF).forEach { glyphProps[it] = GlyphProps(0, 0) }
-        (0x100000..0x10FFFF).forEach { glyphProps[it] = GlyphProps(0, 0) }
-        (0xFFFA0..0xFFFFF).forEach { glyphProps[it] = GlyphProps(0, 0) }
+        codeRange[SHEET_CJK_PUNCT].setFixedWidth(W_ASIAN_PUNCT)
+        codeRange[SHEET_CUSTOM_SYM].setFixedWidth(20)
+        codeRange[SHEET_FW_UNI].setFixedWidth(W_UNIHAN)
+        codeRange[SHEET_HANGUL].setFixedWidth(W_HANGUL_BASE)
+        codeRangeHangulCompat.setFixedWidth(W_HANGUL_BASE)
+        codeRange[SHEET_KANA].setFixedWidth(W_KANA)
+        codeRange[SHEET_RUNIC].setFixedWidth(9)
+        codeRange[SHEET_UNIHAN].setFixedWidth(W_UNIHAN)
+        (0xD800..0xDFFF).setFixedWidth(0)
+        (0x100000..0x10FFFF).setFixedWidth(0)
+        (0xFFFA0..0xFFFFF).setFixedWidth(0)
 
 
         // manually add width of one orphan insular letter
         // WARNING: glyphs in 0xA770..0xA778 has invalid data, further care is required
-        glyphProps[0x1D79] = GlyphProps(9, 0)
+        setGlyphProps(0x1D79, GlyphProps(9, 0))
 
 
         // U+007F is DEL originally, but this font stores bitmap of Replacement Character (U+FFFD)
         // to this position. String replacer will replace U+FFFD into U+007F.
-        glyphProps[0x7F] = GlyphProps(15, 0)
+        setGlyphProps(0x7F, GlyphProps(15, 0))
 
     }
 
@@ -846,14 +757,23 @@ class GameFontBase(
 
     fun getWidth(text: String) = getWidth(text.toCodePoints())
 
+    /** Widths of the strings that have been measured but not drawn, keyed by the hash of the string */
+    private val widthCache = HashMap<Hash, Int>()
+
     fun getWidth(s: CodepointSequence): Int {
-        val cacheObj = getCache(s.getHash())
+        val hash = s.getHash()
+        val cacheObj = getCache(hash)
 
         if (cacheObj != null) {
             return cacheObj.glyphLayout!!.width
         }
         else {
-            return buildPosMap(s).first.last()
+            return widthCache.getOrPut(hash) {
+                // keep it as small as the text cache
+                if (widthCache.size >= textCacheSize) widthCache.clear()
+
+                buildPosMap(s).first.last()
+            }
         }
     }
 
@@ -871,8 +791,6 @@ class GameFontBase(
         var stackUpwardCounter = 0
         var stackDownwardCounter = 0
 
-        val HALF_VAR_INIT = W_VAR_INIT.minus(1).div(2)
-
         // this is starting to get dirty...
         // persisting value. the value is set a few characters before the actual usage
         var extraWidth = 0
@@ -882,16 +800,17 @@ class GameFontBase(
                 // nonDiacriticCounter allows multiple diacritics
 
                 val thisChar = str[charIndex]
-                if (glyphProps[thisChar] == null && errorOnUnknownChar) {
+                val thisPropOrNull = getGlyphProps(thisChar)
+                if (thisPropOrNull == null && errorOnUnknownChar) {
                     val errorGlyphSB = StringBuilder()
                     Character.toChars(thisChar).forEach { errorGlyphSB.append(it) }
 
                     throw InternalError("No GlyphProps for char '$errorGlyphSB' " +
                             "(${thisChar.charInfo()})")
                 }
-                val thisProp = glyphProps[thisChar] ?: nullProp
+                val thisProp = thisPropOrNull ?: nullProp
                 val lastNonDiacriticChar = str[nonDiacriticCounter]
-                val itsProp = glyphProps[lastNonDiacriticChar] ?: nullProp
+                val itsProp = getGlyphProps(lastNonDiacriticChar) ?: nullProp
                 val kerning = getKerning(lastNonDiacriticChar, thisChar)
 
 
@@ -901,7 +820,7 @@ class GameFontBase(
                 var alignmentOffset = when (thisProp.alignWhere) {
                     GlyphProps.ALIGN_LEFT -> 0
                     GlyphProps.ALIGN_RIGHT -> thisProp.width - W_VAR_INIT
-                    GlyphProps.ALIGN_CENTRE -> Math.ceil((thisProp.width - W_VAR_INIT) / 2.0).toInt()
+                    GlyphProps.ALIGN_CENTRE -> Math.floorDiv(thisProp.width - W_VAR_INIT + 1, 2) // ceil(x / 2) in integers
                     else -> 0 // implies "diacriticsBeforeGlyph = true"
                 }
 
@@ -909,16 +828,19 @@ class GameFontBase(
                 // shoehorn the wider-hangul-width thingamajig
                 // widen only when the next hangul char is not "jungseongWide"
                 // (애 in "애슬론" should not be widened)
-                val thisHangulJungseongIndex = toHangulJungseongIndex(thisChar)
-                val nextHangulJungseong1 = toHangulJungseongIndex(str.getOrNull(charIndex + 2) ?: 0) ?: -1
-                val nextHangulJungseong2 = toHangulJungseongIndex(str.getOrNull(charIndex + 3) ?: 0) ?: -1
-                if (isHangulJungseong(thisChar) && thisHangulJungseongIndex in hangulPeaksWithExtraWidth && (
-                                nextHangulJungseong1 !in jungseongWide ||
-                                nextHangulJungseong2 !in jungseongWide
-                        )) {
-                    //println("char: ${thisChar.charInfo()}\nproperties: $thisProp")
-                    //println("${thisChar.charInfo()}  ${str.getOrNull(charIndex + 2)?.charInfo()}  ${str.getOrNull(charIndex + 3)?.charInfo()}")
-                    extraWidth += 1
+                // non-Hangul text skips the lookahead entirely
+                if (isHangulJungseong(thisChar)) {
+                    val thisHangulJungseongIndex = toHangulJungseongIndex(thisChar) ?: -1
+                    val nextHangulJungseong1 = toHangulJungseongIndex(str.getOrNull(charIndex + 2) ?: 0) ?: -1
+                    val nextHangulJungseong2 = toHangulJungseongIndex(str.getOrNull(charIndex + 3) ?: 0) ?: -1
+                    if (thisHangulJungseongIndex in hangulPeaksWithExtraWidth && (
+                                    nextHangulJungseong1 !in jungseongWide ||
+                                    nextHangulJungseong2 !in jungseongWide
+                            )) {
+                        //println("char: ${thisChar.charInfo()}\nproperties: $thisProp")
+                        //println("${thisChar.charInfo()}  ${str.getOrNull(charIndex + 2)?.charInfo()}  ${str.getOrNull(charIndex + 3)?.charInfo()}")
+                        extraWidth += 1
+                    }
                 }
 
 
@@ -984,7 +906,7 @@ class GameFontBase(
                                 posYbuffer[charIndex] = -H_DIACRITICS * stackUpwardCounter
 
                                 // shift down on lowercase if applicable
-                                if (getSheetType(thisChar) in autoShiftDownOnLowercase &&
+                                if (isAutoShiftDownSheet[getSheetType(thisChar)] &&
                                         lastNonDiacriticChar.isLowHeight()) {
                                     //println("AAARRRRHHHH for character ${thisChar.toHex()}")
                                     //println("lastNonDiacriticChar: ${lastNonDiacriticChar.toHex()}")
@@ -1012,8 +934,8 @@ class GameFontBase(
 
         // fill the last of the posXbuffer
         if (str.isNotEmpty()) {
-            val lastCharProp = glyphProps[str.last()]
-            val penultCharProp = glyphProps[nonDiacriticCounter]!!
+            val lastCharProp = getGlyphProps(str.last())
+            val penultCharProp = getGlyphProps(nonDiacriticCounter)!!
             posXbuffer[posXbuffer.lastIndex] = 1 + posXbuffer[posXbuffer.lastIndex - 1] + // adding 1 to house the shadow
                     if (lastCharProp?.writeOnTop == true) {
                         val realDiacriticWidth = if (lastCharProp.alignWhere == GlyphProps.ALIGN_CENTRE) {
@@ -1046,7 +968,7 @@ class GameFontBase(
      * Note to Programmer: DO NOT USE CHAR LITERALS, CODE EDITORS WILL CHANGE IT TO SOMETHING ELSE !!
      */
     private fun CharSequence.toCodePoints(): CodepointSequence {
-        val seq = ArrayList<Int>()
+        val seq = CodepointSequence(this.length) // mostly one code point per char
 
         var i = 0
         while (i < this.length) {
@@ -1092,8 +1014,8 @@ class GameFontBase(
             // {letter, before-diacritics} part will be dealt with swapping code below
             // DOES NOT WORK if said diacritics has codepoint > 0xFFFF
             else if (i < this.lastIndex && this[i + 1].toInt() <= 0xFFFF &&
-                    glyphProps[this[i + 1].toInt()]?.stackWhere == GlyphProps.STACK_BEFORE_N_AFTER) {
-                val diacriticsProp = glyphProps[this[i + 1].toInt()]!!
+                    getGlyphProps(this[i + 1].toInt())?.stackWhere == GlyphProps.STACK_BEFORE_N_AFTER) {
+                val diacriticsProp = getGlyphProps(this[i + 1].toInt())!!
                 seq.add(c.toInt())
                 seq.add(diacriticsProp.extInfo!![0])
                 seq.add(diacriticsProp.extInfo!![1])
@@ -1115,7 +1037,7 @@ class GameFontBase(
         i = 1
         while (i <= seq.lastIndex) {
 
-            if ((glyphProps[seq[i]] ?: nullProp).alignWhere == GlyphProps.ALIGN_BEFORE) {
+            if ((getGlyphProps(seq[i]) ?: nullProp).alignWhere == GlyphProps.ALIGN_BEFORE) {
                 val t = seq[i - 1]
                 seq[i - 1] = seq[i]
                 seq[i] = t
@@ -1202,20 +1124,26 @@ class GameFontBase(
                 -1 to -1
         )
 
-        jobQueue.forEach {
-            for (y in 0 until pixmap.height) {
-                for (x in 0 until pixmap.width) {
+        val width = pixmap.width
+        val height = pixmap.height
+
+        // unpack the offset once per pass, not once per pixel
+        jobQueue.forEach { (dx, dy) ->
+            // only visit the pixels whose shadow lands inside the pixmap; the shadow of the others would be
+            // drawn out of bounds, which Pixmap ignores anyway
+            for (y in maxOf(0, -dy) until minOf(height, height - dy)) {
+                for (x in maxOf(0, -dx) until minOf(width, width - dx)) {
                     val pixel = pixmap.getPixel(x, y) // RGBA8888
 
 
                     // in the current version, all colour-coded glyphs are guaranteed
                     // to be opaque
                     if (pixel and 0xFF == 0xFF) {
-                        val newPixel = pixmap.getPixel(x + it.first, y + it.second)
+                        val newPixel = pixmap.getPixel(x + dx, y + dy)
                         val newColour = pixel.and(0xFFFFFF00.toInt()) or 0x80
 
                         if (newPixel and 0xFF == 0) {
-                            pixmap.drawPixel(x + it.first, y + it.second, newColour)
+                            pixmap.drawPixel(x + dx, y + dy, newColour)
                         }
                     }
                 }
@@ -1229,45 +1157,37 @@ class GameFontBase(
      * @param col RGBA8888 representation
      */
     private fun Pixmap.drawPixmap(pixmap: Pixmap, xPos: Int, yPos: Int, col: Int) {
+        // multiplying by opaque white (the usual case) or onto a blank pixel changes nothing
+        val isColourIdentity = (col == -1)
+
         for (y in 0 until pixmap.height) {
             for (x in 0 until pixmap.width) {
                 val pixel = pixmap.getPixel(x, y) // Pixmap uses RGBA8888, while Color uses ARGB. What the fuck?
 
-                val newPixel = pixel colorTimes col
+                val newPixel = if (isColourIdentity || pixel == 0) pixel else pixel colorTimes col
 
                 this.drawPixel(xPos + x, yPos + y, newPixel)
             }
         }
     }
 
-    private fun Color.toRGBA8888() =
-            (this.r * 255f).toInt().shl(24) or
-                    (this.g * 255f).toInt().shl(16) or
-                    (this.b * 255f).toInt().shl(8) or
-                    (this.a * 255f).toInt()
-
     /**
      * RGBA8888 representation
      */
     private fun Int.forceOpaque() = this.and(0xFFFFFF00.toInt()) or 0xFF
 
+    /**
+     * Channel-wise multiplication of two RGBA8888 colours. Called once per pixel of the linotype, so the channels
+     * are unpacked in place rather than into temporary arrays.
+     */
     private infix fun Int.colorTimes(other: Int): Int {
-        val thisBytes = IntArray(4) { this.ushr(it * 8).and(255) }
-        val otherBytes = IntArray(4) { other.ushr(it * 8).and(255) }
-
-        return (thisBytes[0] times256 otherBytes[0]) or
-               (thisBytes[1] times256 otherBytes[1]).shl(8) or
-               (thisBytes[2] times256 otherBytes[2]).shl(16) or
-               (thisBytes[3] times256 otherBytes[3]).shl(24)
+        return (this.and(255) times256 other.and(255)) or
+               (this.ushr(8).and(255) times256 other.ushr(8).and(255)).shl(8) or
+               (this.ushr(16).and(255) times256 other.ushr(16).and(255)).shl(16) or
+               (this.ushr(24) times256 other.ushr(24)).shl(24)
     }
 
-    private infix fun Int.times256(other: Int) = multTable255[this][other]
-
-    private val multTable255 = Array(256) { left ->
-        IntArray(256) { right ->
-            (255f * (left / 255f).times(right / 255f)).roundToInt()
-        }
-    }
+    private infix fun Int.times256(other: Int) = multTable255[this.shl(8) or other]
 
 
     /** High surrogate comes before the low. */
@@ -1277,6 +1197,10 @@ class GameFontBase(
 
 
     var interchar = 0
+        set(value) {
+            field = value
+            widthCache.clear() // measured widths include the spacing
+        }
     var scale = 1
         set(value) {
             if (value > 0) field = value
@@ -1337,15 +1261,16 @@ class GameFontBase(
         return digest.digest()
     }
     private fun CharSequence.crc32(): Int {
-        val crc = CRC32()
-        this.forEach {
-            val it = it.toInt()
-            val b1 = it.shl(8).and(255)
-            val b2 = it.and(255)
-            crc.update(b1)
-            crc.update(b2)
+        // lay the bytes out first so that the CRC is fed in a single call
+        val bytes = ByteArray(this.length * 2)
+        this.forEachIndexed { index, char ->
+            val it = char.toInt()
+            bytes[index * 2] = it.shl(8).and(255).toByte()
+            bytes[index * 2 + 1] = it.and(255).toByte()
         }
 
+        val crc = CRC32()
+        crc.update(bytes)
         return crc.value.toInt()
     }
 
@@ -1359,6 +1284,7 @@ class GameFontBase(
         internal val W_UNIHAN = 16
         internal val W_LATIN_WIDE = 9 // width of regular letters
         internal val W_VAR_INIT = 15 // it assumes width of 15 regardless of the tagged width
+        internal val HALF_VAR_INIT = W_VAR_INIT.minus(1).div(2)
 
         internal val HGAP_VAR = 1
 
@@ -1414,6 +1340,7 @@ class GameFontBase(
         internal val CHARSET_OVERRIDE_DEFAULT = 0xFFFC0
         internal val CHARSET_OVERRIDE_BG_BG = 0xFFFC1
         internal val CHARSET_OVERRIDE_SR_SR = 0xFFFC2
+        internal val CHARSET_OVERRIDE_MAX = 0xFFFFF
 
 
         private val unihanWidthSheets = arrayOf(
@@ -1446,6 +1373,10 @@ class GameFontBase(
         private val autoShiftDownOnLowercase = arrayOf(
                 SHEET_DIACRITICAL_MARKS_VARW
         )
+        /** Same as [autoShiftDownOnLowercase], as a flag indexed by the sheet (SHEET_UNKNOWN included) */
+        private val isAutoShiftDownSheet = BooleanArray(256).also { flags ->
+            autoShiftDownOnLowercase.forEach { flags[it] = true }
+        }
 
         private val fileList = arrayOf( // MUST BE MATCHING WITH SHEET INDICES!!
                 "ascii_variable.tga",
@@ -1477,38 +1408,116 @@ class GameFontBase(
                 "latinExtC_variable.tga",
                 "latinExtD_variable.tga"
         )
-        private val codeRange = arrayOf( // MUST BE MATCHING WITH SHEET INDICES!!
-                0..0xFF, // SHEET_ASCII_VARW
-                (0x1100..0x11FF) + (0xA960..0xA97F) + (0xD7B0..0xD7FF), // SHEET_HANGUL, because Hangul Syllables are disassembled prior to the render
-                0x100..0x17F, // SHEET_EXTA_VARW
-                0x180..0x24F, // SHEET_EXTB_VARW
-                (0x3040..0x30FF) + (0x31F0..0x31FF) + (0x1B000..0x1B001), // SHEET_KANA
-                0x3000..0x303F, // SHEET_CJK_PUNCT
-                0x3400..0x9FFF, // SHEET_UNIHAN
-                0x400..0x52F, // SHEET_CYRILIC_VARW
-                0xFF00..0xFF1F, // SHEET_FW_UNI
-                0x2000..0x209F, // SHEET_UNI_PUNCT_VARW
-                0x370..0x3CE, // SHEET_GREEK_VARW
-                0xE00..0xE5F, // SHEET_THAI_VARW
-                0x530..0x58F, // SHEET_HAYEREN_VARW
-                0x10D0..0x10FF, // SHEET_KARTULI_VARW
-                0x250..0x2FF, // SHEET_IPA_VARW
-                0x16A0..0x16FF, // SHEET_RUNIC
-                0x1E00..0x1EFF, // SHEET_LATIN_EXT_ADD_VARW
-                0xE000..0xE0FF, // SHEET_CUSTOM_SYM
-                0xF00000..0xF0005F, // SHEET_BULGARIAN_VARW; assign them to PUA
-                0xF00060..0xF000BF, // SHEET_SERBIAN_VARW; assign them to PUA
-                0x13A0..0x13F5, // SHEET_TSALAGI_VARW
-                0xA770..0xA787, // SHEET_INSULAR_VARW; if it work, don't fix it (yet--wait until Latin Extended C)
-                0x900..0x9FF, // SHEET_NAGARI_BENGALI_VARW
-                0x1C90..0x1CBF, // SHEET_KARTULI_CAPS_VARW
-                0x300..0x36F, // SHEET_DIACRITICAL_MARKS_VARW
-                0x1F00..0x1FFF, // SHEET_GREEK_POLY_VARW
-                0x2C60..0x2C7F, // SHEET_EXTC_VARW
-                0xA720..0xA7FF // SHEET_EXTD_VARW
+        private val codeRange: Array<List<IntRange>> = arrayOf( // MUST BE MATCHING WITH SHEET INDICES!!
+                listOf(0..0xFF), // SHEET_ASCII_VARW
+                listOf(0x1100..0x11FF, 0xA960..0xA97F, 0xD7B0..0xD7FF), // SHEET_HANGUL, because Hangul Syllables are disassembled prior to the render
+                listOf(0x100..0x17F), // SHEET_EXTA_VARW
+                listOf(0x180..0x24F), // SHEET_EXTB_VARW
+                listOf(0x3040..0x30FF, 0x31F0..0x31FF, 0x1B000..0x1B001), // SHEET_KANA
+                listOf(0x3000..0x303F), // SHEET_CJK_PUNCT
+                listOf(0x3400..0x9FFF), // SHEET_UNIHAN
+                listOf(0x400..0x52F), // SHEET_CYRILIC_VARW
+                listOf(0xFF00..0xFF1F), // SHEET_FW_UNI
+                listOf(0x2000..0x209F), // SHEET_UNI_PUNCT_VARW
+                listOf(0x370..0x3CE), // SHEET_GREEK_VARW
+                listOf(0xE00..0xE5F), // SHEET_THAI_VARW
+                listOf(0x530..0x58F), // SHEET_HAYEREN_VARW
+                listOf(0x10D0..0x10FF), // SHEET_KARTULI_VARW
+                listOf(0x250..0x2FF), // SHEET_IPA_VARW
+                listOf(0x16A0..0x16FF), // SHEET_RUNIC
+                listOf(0x1E00..0x1EFF), // SHEET_LATIN_EXT_ADD_VARW
+                listOf(0xE000..0xE0FF), // SHEET_CUSTOM_SYM
+                listOf(0xF00000..0xF0005F), // SHEET_BULGARIAN_VARW; assign them to PUA
+                listOf(0xF00060..0xF000BF), // SHEET_SERBIAN_VARW; assign them to PUA
+                listOf(0x13A0..0x13F5), // SHEET_TSALAGI_VARW
+                listOf(0xA770..0xA787), // SHEET_INSULAR_VARW; if it work, don't fix it (yet--wait until Latin Extended C)
+                listOf(0x900..0x9FF), // SHEET_NAGARI_BENGALI_VARW
+                listOf(0x1C90..0x1CBF), // SHEET_KARTULI_CAPS_VARW
+                listOf(0x300..0x36F), // SHEET_DIACRITICAL_MARKS_VARW
+                listOf(0x1F00..0x1FFF), // SHEET_GREEK_POLY_VARW
+                listOf(0x2C60..0x2C7F), // SHEET_EXTC_VARW
+                listOf(0xA720..0xA7FF) // SHEET_EXTD_VARW
         )
         private val codeRangeHangulCompat = 0x3130..0x318F
 
+        /** Sheet that takes over the Bulgarian range under each charset override (CHARSET_OVERRIDE_* minus the default), or -1 */
+        private val charsetOverrideSheet = IntArray(CHARSET_OVERRIDE_MAX - CHARSET_OVERRIDE_DEFAULT + 1) { -1 }.also { sheets ->
+            sheets[CHARSET_OVERRIDE_BG_BG - CHARSET_OVERRIDE_DEFAULT] = SHEET_BULGARIAN_VARW
+            sheets[CHARSET_OVERRIDE_SR_SR - CHARSET_OVERRIDE_DEFAULT] = SHEET_SERBIAN_VARW
+        }
+
+        /** Order in which [getSheetType] claims a codepoint when sheets overlap */
+        private val sheetLookupOrder = arrayOf(
+                SHEET_HANGUL,
+                SHEET_KANA,
+                SHEET_UNIHAN,
+                SHEET_ASCII_VARW,
+                SHEET_EXTA_VARW,
+                SHEET_EXTB_VARW,
+                SHEET_CYRILIC_VARW,
+                SHEET_UNI_PUNCT_VARW,
+                SHEET_CJK_PUNCT,
+                SHEET_FW_UNI,
+                SHEET_GREEK_VARW,
+                SHEET_THAI_VARW,
+                SHEET_CUSTOM_SYM,
+                SHEET_HAYEREN_VARW,
+                SHEET_KARTULI_VARW,
+                SHEET_IPA_VARW,
+                SHEET_RUNIC,
+                SHEET_LATIN_EXT_ADD_VARW,
+                SHEET_TSALAGI_VARW,
+                SHEET_INSUAR_VARW,
+                SHEET_NAGARI_BENGALI_VARW,
+                SHEET_KARTULI_CAPS_VARW,
+                SHEET_DIACRITICAL_MARKS_VARW,
+                SHEET_GREEK_POLY_VARW,
+                SHEET_EXTC_VARW,
+                SHEET_EXTD_VARW
+        )
+        /** Sheet of every BMP codepoint, charset overrides not applied. Read it with `and 0xFF` */
+        private val sheetOfBMP = ByteArray(0x10000).also { lut ->
+            lut.fill(SHEET_UNKNOWN.toByte())
+            // lowest precedence first, so the earlier sheet wins on overlap
+            sheetLookupOrder.reversed().forEach { sheet ->
+                val ranges = when (sheet) {
+                    SHEET_HANGUL -> codeRange[sheet] + listOf(codeRangeHangulCompat)
+                    SHEET_INSUAR_VARW -> listOf(0x1D79..0x1D79) // the rest of the sheet is claimed by Latin Ext-D
+                    else -> codeRange[sheet]
+                }
+                ranges.filter { it.first < 0x10000 }.forEach {
+                    lut.fill(sheet.toByte(), it.first, minOf(it.last, 0xFFFF) + 1)
+                }
+            }
+        }
+
+        /** First codepoint of each 16-column sheet, indexed by the sheet (SHEET_UNKNOWN included); zero means the codepoint itself */
+        private val sheetCodeOffset = IntArray(256).also { offsets ->
+            offsets[SHEET_EXTA_VARW] = 0x100
+            offsets[SHEET_EXTB_VARW] = 0x180
+            offsets[SHEET_CJK_PUNCT] = 0x3000
+            offsets[SHEET_CYRILIC_VARW] = 0x400
+            offsets[SHEET_FW_UNI] = 0xFF00
+            offsets[SHEET_UNI_PUNCT_VARW] = 0x2000
+            offsets[SHEET_GREEK_VARW] = 0x370
+            offsets[SHEET_THAI_VARW] = 0xE00
+            offsets[SHEET_CUSTOM_SYM] = 0xE000
+            offsets[SHEET_HAYEREN_VARW] = 0x530
+            offsets[SHEET_KARTULI_VARW] = 0x10D0
+            offsets[SHEET_IPA_VARW] = 0x250
+            offsets[SHEET_RUNIC] = 0x16A0
+            offsets[SHEET_LATIN_EXT_ADD_VARW] = 0x1E00
+            offsets[SHEET_BULGARIAN_VARW] = 0x400 // expects Unicode charpoint, NOT an internal one
+            offsets[SHEET_SERBIAN_VARW] = 0x400
+            offsets[SHEET_TSALAGI_VARW] = 0x13A0
+            offsets[SHEET_NAGARI_BENGALI_VARW] = 0x900
+            offsets[SHEET_KARTULI_CAPS_VARW] = 0x1C90
+            offsets[SHEET_DIACRITICAL_MARKS_VARW] = 0x300
+            offsets[SHEET_GREEK_POLY_VARW] = 0x1F00
+            offsets[SHEET_EXTC_VARW] = 0x2C60
+            offsets[SHEET_EXTD_VARW] = 0xA720
+        }
+
         private fun Int.toHex() = "U+${this.toString(16).padStart(4, '0').toUpperCase()}"
 
         // Hangul Implementation Specific //
@@ -1517,27 +1526,48 @@ class GameFontBase(
         private fun getWanseongHanJungseong(hanIndex: Int) = hanIndex / JONG_COUNT % JUNG_COUNT
         private fun getWanseongHanJongseong(hanIndex: Int) = hanIndex % JONG_COUNT
 
-        // THESE ARRAYS MUST BE SORTED
+        private fun bitSetOf(vararg bits: Int) = BitSet().apply { bits.forEach { set(it) } }
+        /** Negative indices (e.g. -1 for "no jungseong") are never in the set */
+        private operator fun BitSet.contains(i: Int) = i >= 0 && get(i)
+
+        // sets of jungseong (peak) indices; BitSet as the indices are small and tested for every Hangul syllable
         // ㅣ
-        private val jungseongI = arrayOf(21,61).toSortedSet()
+        private val jungseongI = bitSetOf(21,61)
         // ㅗ ㅛ ㅜ ㅠ
-        private val jungseongOU = arrayOf(9,13,14,18,34,35,39,45,51,53,54,64,80,83).toSortedSet()
+        private val jungseongOU = bitSetOf(9,13,14,18,34,35,39,45,51,53,54,64,80,83)
         // ㅘ ㅙ ㅞ
-        private val jungseongOUComplex = (arrayOf(10,11,16) + (22..33).toList() + arrayOf(36,37,38) + (41..44).toList() + arrayOf(46,47,48,49,50) + (56..59).toList() + arrayOf(63) + (67..79).toList() + arrayOf(81,82) + (84..93).toList()).toSortedSet()
+        private val jungseongOUComplex = bitSetOf(10,11,16,36,37,38,46,47,48,49,50,63,81,82).apply {
+            set(22, 33 + 1); set(41, 44 + 1); set(56, 59 + 1); set(67, 79 + 1); set(84, 93 + 1)
+        }
         // ㅐ ㅒ ㅔ ㅖ etc
-        private val jungseongRightie = arrayOf(2,4,6,8,11,16,32,33,37,42,44,48,50,71,72,75,78,79,83,86,87,88,94).toSortedSet()
+        private val jungseongRightie = bitSetOf(2,4,6,8,11,16,32,33,37,42,44,48,50,71,72,75,78,79,83,86,87,88,94)
         // ㅚ *ㅝ* ㅟ
-        private val jungseongOEWI = arrayOf(12,15,17,40,52,55,89,90,91).toSortedSet()
+        private val jungseongOEWI = bitSetOf(12,15,17,40,52,55,89,90,91)
         // ㅡ
-        private val jungseongEU = arrayOf(19,62,66).toSortedSet()
+        private val jungseongEU = bitSetOf(19,62,66)
         // ㅢ
-        private val jungseongYI = arrayOf(20,60,65).toSortedSet()
+        private val jungseongYI = bitSetOf(20,60,65)
 
-        private val jungseongWide = (jungseongOU.toList() + jungseongEU.toList()).toSortedSet()
+        private val jungseongWide = (jungseongOU.clone() as BitSet).apply { or(jungseongEU) }
 
         // index of the peak, 0 being blank, 1 being ㅏ
         // indices of peaks that number of lit pixels (vertically counted) on x=11 is greater than 7
-        private val hangulPeaksWithExtraWidth = arrayOf(2,4,6,8,11,16,32,33,37,42,44,48,50,71,75,78,79,83,86,87,88,94).toSortedSet()
+        private val hangulPeaksWithExtraWidth = bitSetOf(2,4,6,8,11,16,32,33,37,42,44,48,50,71,75,78,79,83,86,87,88,94)
+
+        // rows of the initial and the final only depend on the peak, so they are worked out once for every peak
+        // index (0..94) instead of probing the sets above for each syllable
+        private val hanInitialRowByPeak = IntArray(128) { p ->
+            if (p in jungseongI) 3
+            else if (p in jungseongOUComplex) 7
+            else if (p in jungseongOEWI) 11
+            else if (p in jungseongOU) 5
+            else if (p in jungseongEU) 9
+            else if (p in jungseongYI) 13
+            else 1
+        }
+        private val hanFinalRowByPeak = IntArray(128) { p ->
+            if (p !in jungseongRightie) 17 else 18
+        }
 
         /**
          * @param i Initial (Choseong)
@@ -1545,44 +1575,32 @@ class GameFontBase(
          * @param f Final (Jongseong)
          */
         private fun getHanInitialRow(i: Int, p: Int, f: Int): Int {
-            val ret =
-                    if (p in jungseongI) 3
-                    else if (p in jungseongOUComplex) 7
-                    else if (p in jungseongOEWI) 11
-                    else if (p in jungseongOU) 5
-                    else if (p in jungseongEU) 9
-                    else if (p in jungseongYI) 13
-                    else 1
+            val ret = hanInitialRowByPeak[p]
 
             return if (f == 0) ret else ret + 1
         }
 
         private fun getHanMedialRow(i: Int, p: Int, f: Int) = if (f == 0) 15 else 16
 
-        private fun getHanFinalRow(i: Int, p: Int, f: Int): Int {
-
-            return if (p !in jungseongRightie)
-                17
-            else
-                18
-        }
+        private fun getHanFinalRow(i: Int, p: Int, f: Int) = hanFinalRowByPeak[p]
 
         private fun isHangulChoseong(c: CodePoint) = c in (0x1100..0x115F) || c in (0xA960..0xA97F)
         private fun isHangulJungseong(c: CodePoint) = c in (0x1160..0x11A7) || c in (0xD7B0..0xD7C6)
         private fun isHangulJongseong(c: CodePoint) = c in (0x11A8..0x11FF) || c in (0xD7CB..0xD7FB)
 
+        // each range is tested once; the is-functions above would test the same ranges again
         private fun toHangulChoseongIndex(c: CodePoint) =
-                if (!isHangulChoseong(c)) throw IllegalArgumentException("This Hangul sequence does not begin with Choseong (${c.toHex()})")
-                else if (c in 0x1100..0x115F) c - 0x1100
-                else c - 0xA960 + 96
+                if (c in 0x1100..0x115F) c - 0x1100
+                else if (c in 0xA960..0xA97F) c - 0xA960 + 96
+                else throw IllegalArgumentException("This Hangul sequence does not begin with Choseong (${c.toHex()})")
         private fun toHangulJungseongIndex(c: CodePoint) =
-                if (!isHangulJungseong(c)) null
-                else if (c in 0x1160..0x11A7) c - 0x1160
-                else c - 0xD7B0 + 72
+                if (c in 0x1160..0x11A7) c - 0x1160
+                else if (c in 0xD7B0..0xD7C6) c - 0xD7B0 + 72
+                else null
         private fun toHangulJongseongIndex(c: CodePoint) =
-                if (!isHangulJongseong(c)) null
-                else if (c in 0x11A8..0x11FF) c - 0x11A8 + 1
-                else c - 0xD7CB + 88 + 1
+                if (c in 0x11A8..0x11FF) c - 0x11A8 + 1
+                else if (c in 0xD7CB..0xD7FB) c - 0xD7CB + 88 + 1
+                else null
 
         /**
          * X-position in the spritesheet
@@ -1624,121 +1642,37 @@ class GameFontBase(
 
         // END Hangul //
 
-        private fun isHangul(c: CodePoint) = c in codeRange[SHEET_HANGUL] || c in 0x3130..0x318F
-        private fun isAscii(c: CodePoint) = c in codeRange[SHEET_ASCII_VARW]
-        private fun isRunic(c: CodePoint) = c in codeRange[SHEET_RUNIC]
-        private fun isExtA(c: CodePoint) = c in codeRange[SHEET_EXTA_VARW]
-        private fun isExtB(c: CodePoint) = c in codeRange[SHEET_EXTB_VARW]
-        private fun isKana(c: CodePoint) = c in codeRange[SHEET_KANA]
-        private fun isCJKPunct(c: CodePoint) = c in codeRange[SHEET_CJK_PUNCT]
-        private fun isUniHan(c: CodePoint) = c in codeRange[SHEET_UNIHAN]
-        private fun isCyrilic(c: CodePoint) = c in codeRange[SHEET_CYRILIC_VARW]
-        private fun isFullwidthUni(c: CodePoint) = c in codeRange[SHEET_FW_UNI]
-        private fun isUniPunct(c: CodePoint) = c in codeRange[SHEET_UNI_PUNCT_VARW]
-        private fun isGreek(c: CodePoint) = c in codeRange[SHEET_GREEK_VARW]
-        private fun isThai(c: CodePoint) = c in codeRange[SHEET_THAI_VARW]
+        private fun isInCodeRange(c: CodePoint, sheet: Int) = codeRange[sheet].any { c in it }
+
+        private fun isHangul(c: CodePoint) = isInCodeRange(c, SHEET_HANGUL) || c in 0x3130..0x318F
+        private fun isKana(c: CodePoint) = isInCodeRange(c, SHEET_KANA)
         /*private fun isDiacritics(c: CodePoint) = c in 0xE34..0xE3A
                 || c in 0xE47..0xE4E
                 || c == 0xE31*/
-        private fun isCustomSym(c: CodePoint) = c in codeRange[SHEET_CUSTOM_SYM]
-        private fun isArmenian(c: CodePoint) = c in codeRange[SHEET_HAYEREN_VARW]
-        private fun isKartvelian(c: CodePoint) = c in codeRange[SHEET_KARTULI_VARW]
-        private fun isIPA(c: CodePoint) = c in codeRange[SHEET_IPA_VARW]
-        private fun isLatinExtAdd(c: CodePoint) = c in 0x1E00..0x1EFF
         private fun isBulgarian(c: CodePoint) = c in 0x400..0x45F
         private fun isColourCode(c: CodePoint) = c == 0x100000 || c in 0x10F000..0x10FFFF
-        private fun isCharsetOverride(c: CodePoint) = c in 0xFFFC0..0xFFFFF
-        private fun isCherokee(c: CodePoint) = c in codeRange[SHEET_TSALAGI_VARW]
-        private fun isInsular(c: CodePoint) = c == 0x1D79
-        private fun isNagariBengali(c: CodePoint) = c in codeRange[SHEET_NAGARI_BENGALI_VARW]
-        private fun isKartvelianCaps(c: CodePoint) = c in codeRange[SHEET_KARTULI_CAPS_VARW]
-        private fun isDiacriticalMarks(c: CodePoint) = c in codeRange[SHEET_DIACRITICAL_MARKS_VARW]
-        private fun isPolytonicGreek(c: CodePoint) = c in codeRange[SHEET_GREEK_POLY_VARW]
-        private fun isExtC(c: CodePoint) = c in codeRange[SHEET_EXTC_VARW]
-        private fun isExtD(c: CodePoint) = c in codeRange[SHEET_EXTD_VARW]
+        private fun isCharsetOverride(c: CodePoint) = c in CHARSET_OVERRIDE_DEFAULT..CHARSET_OVERRIDE_MAX
+        private fun isKartvelianCaps(c: CodePoint) = isInCodeRange(c, SHEET_KARTULI_CAPS_VARW)
         private fun isHangulCompat(c: CodePoint) = c in codeRangeHangulCompat
 
         // underscored name: not a charset
         private fun _isCaps(c: CodePoint) = Character.isUpperCase(c) || isKartvelianCaps(c)
 
 
-        private fun extAindexX(c: CodePoint) = (c - 0x100) % 16
-        private fun extAindexY(c: CodePoint) = (c - 0x100) / 16
-
-        private fun extBindexX(c: CodePoint) = (c - 0x180) % 16
-        private fun extBindexY(c: CodePoint) = (c - 0x180) / 16
-
-        private fun runicIndexX(c: CodePoint) = (c - 0x16A0) % 16
-        private fun runicIndexY(c: CodePoint) = (c - 0x16A0) / 16
-
         private fun kanaIndexX(c: CodePoint) = (c - 0x3040) % 16
         private fun kanaIndexY(c: CodePoint) =
                 if (c in 0x31F0..0x31FF) 12
                 else if (c in 0x1B000..0x1B00F) 13
                 else (c - 0x3040) / 16
 
-        private fun cjkPunctIndexX(c: CodePoint) = (c - 0x3000) % 16
-        private fun cjkPunctIndexY(c: CodePoint) = (c - 0x3000) / 16
-
-        private fun cyrilicIndexX(c: CodePoint) = (c - 0x400) % 16
-        private fun cyrilicIndexY(c: CodePoint) = (c - 0x400) / 16
-
-        private fun fullwidthUniIndexX(c: CodePoint) = (c - 0xFF00) % 16
-        private fun fullwidthUniIndexY(c: CodePoint) = (c - 0xFF00) / 16
-
-        private fun uniPunctIndexX(c: CodePoint) = (c - 0x2000) % 16
-        private fun uniPunctIndexY(c: CodePoint) = (c - 0x2000) / 16
-
         private fun unihanIndexX(c: CodePoint) = (c - 0x3400) % 256
         private fun unihanIndexY(c: CodePoint) = (c - 0x3400) / 256
 
-        private fun greekIndexX(c: CodePoint) = (c - 0x370) % 16
-        private fun greekIndexY(c: CodePoint) = (c - 0x370) / 16
-
-        private fun thaiIndexX(c: CodePoint) = (c - 0xE00) % 16
-        private fun thaiIndexY(c: CodePoint) = (c - 0xE00) / 16
-
-        private fun symbolIndexX(c: CodePoint) = (c - 0xE000) % 16
-        private fun symbolIndexY(c: CodePoint) = (c - 0xE000) / 16
-
-        private fun armenianIndexX(c: CodePoint) = (c - 0x530) % 16
-        private fun armenianIndexY(c: CodePoint) = (c - 0x530) / 16
-
-        private fun kartvelianIndexX(c: CodePoint) = (c - 0x10D0) % 16
-        private fun kartvelianIndexY(c: CodePoint) = (c - 0x10D0) / 16
-
-        private fun ipaIndexX(c: CodePoint) = (c - 0x250) % 16
-        private fun ipaIndexY(c: CodePoint) = (c - 0x250) / 16
-
-        private fun latinExtAddX(c: CodePoint) = (c - 0x1E00) % 16
-        private fun latinExtAddY(c: CodePoint) = (c - 0x1E00) / 16
-
-        private fun cherokeeIndexX(c: CodePoint) = (c - 0x13A0) % 16
-        private fun cherokeeIndexY(c: CodePoint) = (c - 0x13A0) / 16
-
         private fun insularIndexX(c: CodePoint) =
                 if (c == 0x1D79) 0 else (c - 0xA770) % 16
         private fun insularIndexY(c: CodePoint) =
                 if (c == 0x1D79) 0 else (c - 0xA770) / 16
 
-        private fun nagariIndexX(c: CodePoint) = (c - 0x900) % 16
-        private fun nagariIndexY(c: CodePoint) = (c - 0x900) / 16
-
-        private fun kartvelianCapsIndexX(c: CodePoint) = (c - 0x1C90) % 16
-        private fun kartvelianCapsIndexY(c: CodePoint) = (c - 0x1C90) / 16
-
-        private fun diacriticalMarksIndexX(c: CodePoint) = (c - 0x300) % 16
-        private fun diacriticalMarksIndexY(c: CodePoint) = (c - 0x300) / 16
-
-        private fun polytonicGreekIndexX(c: CodePoint) = (c - 0x1F00) % 16
-        private fun polytonicGreekIndexY(c: CodePoint) = (c - 0x1F00) / 16
-
-        private fun extCIndexX(c: CodePoint) = (c - 0x2C60) % 16
-        private fun extCIndexY(c: CodePoint) = (c - 0x2C60) / 16
-
-        private fun extDIndexX(c: CodePoint) = (c - 0xA720) % 16
-        private fun extDIndexY(c: CodePoint) = (c - 0xA720) / 16
-
         /*
 #!/usr/bin/python3
 
@@ -1772,54 +1706,93 @@ print("0x{0:x}".format(ord(c)))
         private val kernYee = -1
         private val kernAV = -1
 
+        // kerning classes as bit flags; a letter may belong to more than one class
+        private val KERN_LOWHEIGHT = 1
+        private val KERN_TEE = 2
+        private val KERN_YEE = 4
+        private val KERN_VEE = 8
+        private val KERN_AYE = 16
+        private val KERN_ELL = 32
+        private val KERN_GAMMA = 64
+        private val KERN_JAY = 128
+        private val KERN_DEE = 256
+        private val KERN_BEE = 512
+
+        /**
+         * All the kerning classes a letter belongs to, merged into one bitmask so that [getKerning] only does
+         * two lookups instead of probing the sets one by one.
+         */
+        private val kernClasses = HashMap<CodePoint, Int>().also { map ->
+            fun Iterable<Int>.markAs(flag: Int) = this.forEach { map[it] = (map[it] ?: 0) or flag }
+
+            lowHeightLetters.markAs(KERN_LOWHEIGHT)
+            kernTees.markAs(KERN_TEE)
+            kernYees.markAs(KERN_YEE)
+            kernVees.markAs(KERN_VEE)
+            kernAyes.markAs(KERN_AYE)
+            kernElls.markAs(KERN_ELL)
+            kernGammas.markAs(KERN_GAMMA)
+            kernJays.markAs(KERN_JAY)
+            kernDees.asIterable().markAs(KERN_DEE)
+            kernBees.asIterable().markAs(KERN_BEE)
+        }
+
+        private fun getKernClass(c: CodePoint) = kernClasses[c] ?: 0
+        private infix fun Int.hasKernClass(flag: Int) = this and flag != 0
+
         private fun getKerning(prevChar: CodePoint, thisChar: CodePoint): Int {
-            return if (prevChar in lowHeightLetters) {
-                return if (thisChar in kernTees) kernTee // lh - T
-                else if (thisChar in kernYees) kernYee   // lh - Y
+            val prev = getKernClass(prevChar)
+            if (prev == 0) return 0
+            val cur = getKernClass(thisChar)
+            if (cur == 0) return 0
+
+            return if (prev hasKernClass KERN_LOWHEIGHT) {
+                if (cur hasKernClass KERN_TEE) kernTee // lh - T
+                else if (cur hasKernClass KERN_YEE) kernYee   // lh - Y
                 else 0
             }
-            else if (prevChar in kernElls) {
-                return if (thisChar in kernTees) kernTee // L - T
-                else if (thisChar in kernVees) kernYee   // L - V
-                else if (thisChar in kernYees) kernYee   // L - Y
+            else if (prev hasKernClass KERN_ELL) {
+                if (cur hasKernClass KERN_TEE) kernTee // L - T
+                else if (cur hasKernClass KERN_VEE) kernYee   // L - V
+                else if (cur hasKernClass KERN_YEE) kernYee   // L - Y
                 else 0
             }
-            else if (prevChar in kernTees) {
-                return if (thisChar in lowHeightLetters) kernTee // T - lh
-                else if (thisChar in kernJays) kernTee           // T - J
-                else if (thisChar in kernAyes) kernYee           // T - A
-                else if (thisChar in kernDees) kernTee           // T - d
+            else if (prev hasKernClass KERN_TEE) {
+                if (cur hasKernClass KERN_LOWHEIGHT) kernTee // T - lh
+                else if (cur hasKernClass KERN_JAY) kernTee           // T - J
+                else if (cur hasKernClass KERN_AYE) kernYee           // T - A
+                else if (cur hasKernClass KERN_DEE) kernTee           // T - d
                 else 0
             }
-            else if (prevChar in kernYees) {
-                return if (thisChar in lowHeightLetters) kernYee // Y - lh
-                else if (thisChar in kernAyes) kernYee           // Y - A
-                else if (thisChar in kernJays) kernYee           // Y - J
-                else if (thisChar in kernDees) kernYee           // Y - d
+            else if (prev hasKernClass KERN_YEE) {
+                if (cur hasKernClass KERN_LOWHEIGHT) kernYee // Y - lh
+                else if (cur hasKernClass KERN_AYE) kernYee           // Y - A
+                else if (cur hasKernClass KERN_JAY) kernYee           // Y - J
+                else if (cur hasKernClass KERN_DEE) kernYee           // Y - d
                 else 0
             }
-            else if (prevChar in kernAyes) {
-                return if (thisChar in kernVees) kernAV  // A - V
-                else if (thisChar in kernTees) kernAV    // A - T
-                else if (thisChar in kernYees) kernYee   // A - Y
+            else if (prev hasKernClass KERN_AYE) {
+                if (cur hasKernClass KERN_VEE) kernAV  // A - V
+                else if (cur hasKernClass KERN_TEE) kernAV    // A - T
+                else if (cur hasKernClass KERN_YEE) kernYee   // A - Y
                 else 0
             }
-            else if (prevChar in kernVees) {
-                return if (thisChar in kernAyes) kernAV  // V - A
-                else if (thisChar in kernJays) kernAV    // V - J
-                else if (thisChar in kernDees) kernAV    // V - d
+            else if (prev hasKernClass KERN_VEE) {
+                if (cur hasKernClass KERN_AYE) kernAV  // V - A
+                else if (cur hasKernClass KERN_JAY) kernAV    // V - J
+                else if (cur hasKernClass KERN_DEE) kernAV    // V - d
                 else 0
             }
-            else if (prevChar in kernGammas) {
-                return if (thisChar in kernAyes) kernYee       // Γ - Α
-                else if (thisChar in lowHeightLetters) kernTee // Γ - lh
-                else if (thisChar in kernJays) kernTee         // Γ - J
-                else if (thisChar in kernDees) kernTee         // Γ - d
+            else if (prev hasKernClass KERN_GAMMA) {
+                if (cur hasKernClass KERN_AYE) kernYee       // Γ - Α
+                else if (cur hasKernClass KERN_LOWHEIGHT) kernTee // Γ - lh
+                else if (cur hasKernClass KERN_JAY) kernTee         // Γ - J
+                else if (cur hasKernClass KERN_DEE) kernTee         // Γ - d
                 else 0
             }
-            else if (prevChar in kernBees) {
-                return if (thisChar in kernTees) kernTee // b - T
-                else if (thisChar in kernYees) kernYee   // b - Y
+            else if (prev hasKernClass KERN_BEE) {
+                if (cur hasKernClass KERN_TEE) kernTee // b - T
+                else if (cur hasKernClass KERN_YEE) kernYee   // b - Y
                 else 0
             }
             else 0
@@ -1829,11 +1802,22 @@ print("0x{0:x}".format(ord(c)))
         val charsetOverrideDefault = Character.toChars(CHARSET_OVERRIDE_DEFAULT)
         val charsetOverrideBulgarian = Character.toChars(CHARSET_OVERRIDE_BG_BG)
         val charsetOverrideSerbian = Character.toChars(CHARSET_OVERRIDE_SR_SR)
-        fun toColorCode(argb4444: Int): String = Character.toChars(0x100000 + argb4444).toColCode()
+        /** Colour codes are pure functions of the colour, and the same handful of colours gets asked for every frame */
+        private val colorCodeCache = ConcurrentHashMap<Int, String>()
+        fun toColorCode(argb4444: Int): String = colorCodeCache.getOrPut(argb4444) {
+            Character.toChars(0x100000 + argb4444).toColCode()
+        }
         fun toColorCode(r: Int, g: Int, b: Int, a: Int = 0x0F): String = toColorCode(a.shl(12) or r.shl(8) or g.shl(4) or b)
         private fun CharArray.toColCode(): String = "${this[0]}${this[1]}"
 
         val noColorCode = toColorCode(0x0000)
+
+        /** 256x256 table flattened into one array; index is (left shl 8) or right. Shared by every font instance */
+        private val multTable255 = IntArray(65536) {
+            val left = it.ushr(8)
+            val right = it.and(255)
+            (255f * (left / 255f).times(right / 255f)).roundToInt()
+        }
     }
 
 }